@@ -1,21 +1,38 @@
 #!/usr/bin/env python
+import time
+_START = time.perf_counter()  # noqa: E402, measured before any other import
+
 import asyncio
 from argparse import ArgumentParser
 from functools import partial
 import logging
 import os
-import time
+import sys
 
 from . import camera
-from . import client_helpers as ch
-from .mjpeg_server import MjpegServer
+from .preprocess import Preprocessor, add_preprocess_args
+from .stacking import FrameStacker, add_stacking_args
 
 logging.basicConfig()
 logger = logging.getLogger('client')
 logger.setLevel(logging.INFO)
 
 
+def startup_report(args):
+    if not args.startup_report:
+        return
+    logger.info(f"startup took {(time.perf_counter() - _START) * 1000:.1f} ms")
+    for module, seconds in camera.IMPORT_TIMES.items():
+        logger.info(f"  import {module}: {seconds * 1000:.1f} ms")
+    loaded = [m for m in ('requests', 'aiohttp', 'cv2') if m in sys.modules]
+    logger.info(f"  loaded optional modules: {loaded}")
+    logger.info("run with 'python -X importtime -m client ...' "
+                "for a per-module breakdown")
+
+
 def run(args):
+    # requests and the client config are only needed for the run mode
+    from . import client_helpers as ch
 
     if ch.is_ip(args.output):
         save_func = partial(ch.post_image, args.output)
@@ -24,21 +41,37 @@ def run(args):
             os.makedirs(args.output)
         save_func = partial(ch.save_image, args.output)
 
+    preprocess = Preprocessor.from_args(args)
+    stacker = FrameStacker.from_args(args)
+
+    def capture(cam):
+        startup_report(args)
+        args.startup_report = False
+        ch.capture_image(cam, save_func, preprocess, stacker)
+
+    cam_cls = camera.CAMERAS[args.camera]
+    if cam_cls.keep_open:
+        with cam_cls.from_args(args) as cam:
+            while True:
+                capture(cam)
+                time.sleep(args.time)
+
     while True:
-        with getattr(camera, args.camera)() as cam:
-            ch.capture_image(cam, save_func)
+        with cam_cls.from_args(args) as cam:
+            capture(cam)
         time.sleep(args.time)
 
 
 def stream(args):
+    # aiohttp is only needed for the stream mode
+    from .mjpeg_server import MjpegServer
 
     print(args)
-    cam = getattr(camera, args.camera)()
+    cam = camera.CAMERAS[args.camera].from_args(args)
     mjpeg = MjpegServer(port=args.port)
-    if args.camera == "PiCam":
-        mjpeg.add_stream('stream', cam.stream)
-    else:
-        mjpeg.add_stream('stream', cam.capture)
+    preprocess = Preprocessor.from_args(args)
+    mjpeg.add_stream('stream', cam.stream_source(preprocess))
+    startup_report(args)
 
     try:
         asyncio.run(mjpeg.start())
@@ -52,31 +85,37 @@ def stream(args):
 if __name__ == "__main__":
 
     parser = ArgumentParser(description="Timelapse Camera")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="Log startup and backend import times")
     sub_parsers = parser.add_subparsers(
         help='run <cmd> --help for subcommand  options')
 
     run_parser = sub_parsers.add_parser('run', help='start application')
-    run_parser.add_argument("-c", "--camera", help="Type of camera",
-                            default="WebCam",
-                            choices=["WebCam", "Basler", "DigitalCam", "PiCam"])
+    camera.add_camera_args(run_parser)
     run_parser.add_argument("-t", "--time", required=True,
                             type=int, help="Time interval for capture")
     run_parser.add_argument("-o", "--output", required=True,
                             help="Path/URL to save/upload images")
+    add_preprocess_args(run_parser)
+    add_stacking_args(run_parser)
     run_parser.set_defaults(func=run)
 
     stream_parser = sub_parsers.add_parser('stream', help='start mjpeg stream')
     stream_parser.add_argument(
         '-p', '--port', type=str, default='8080', help='Mjpeg steam port')
-    stream_parser.add_argument("-c", "--camera", help="Type of camera",
-                               default="WebCam",
-                               choices=["WebCam", "Basler", "DigitalCam", "PiCam"])
+    camera.add_camera_args(stream_parser)
+    add_preprocess_args(stream_parser)
     stream_parser.set_defaults(func=stream)
 
     parser.prog = "client"
     run_parser.prog = f"{parser.prog} run"
     stream_parser.prog = f"{parser.prog} stream"
     args = parser.parse_args()
+    if hasattr(args, 'camera'):
+        camera.check_camera_args(parser, args)
+        cam_cls = camera.CAMERAS[args.camera]
+        if getattr(args, 'bracket', None) and not cam_cls.supports_exposure:
+            parser.error(f"{args.camera} does not support --bracket")
 
     try:
         args.func(args)
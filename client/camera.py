@@ -1,40 +1,87 @@
 from abc import ABC, abstractmethod
+import asyncio
+from datetime import datetime
+import glob
+import importlib
 import os
 import logging
+import queue
+import sys
+import threading
 import time
+import typing as T
 
-import cv2
 import numpy as np
 
 logging.basicConfig()
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+logger = logging.getLogger('camera')
+logger.setLevel(logging.INFO)
 
+# registry of camera name -> class, filled by @register below
+CAMERAS: T.Dict[str, T.Type["Camera"]] = {}
+# seconds spent importing each lazily loaded backend module
+IMPORT_TIMES: T.Dict[str, float] = {}
 
-try:
-    import gphoto2 as gp
-except (ImportError, ModuleNotFoundError):
-    logger.warning("Failed to import gphoto2 "
-                   "Only needed for DigitalCamera")
-try:
-    from pypylon import pylon
-except (ImportError, ModuleNotFoundError):
-    logger.warning("Failed to import pypylon "
-                   "Only needed for Basler Camera")
 
-try:
-    from picamera import PiCamera
-    from picamera.array import PiRGBArray
-except (ImportError, ModuleNotFoundError):
-    logger.warning("Failed to import picamera "
-                   "Only needed for Pi-Cam")
+def register(name: str):
+    def wrapper(cls):
+        CAMERAS[name] = cls
+        return cls
+    return wrapper
+
+
+def add_camera_args(parser, default: str = "WebCam") -> None:
+    parser.add_argument("-c", "--camera", help="Type of camera",
+                        default=default,
+                        choices=list(CAMERAS))
+    for cls in dict.fromkeys(CAMERAS.values()):
+        cls.add_args(parser)
+
+
+def check_camera_args(parser, args) -> None:
+    try:
+        CAMERAS[args.camera].check_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+def import_backend(module: str, package: str, camera: str):
+    """Import a backend module on first use and record its cost."""
+    loaded = module in sys.modules
+    start = time.perf_counter()
+    try:
+        mod = importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(f"{package} is required for {camera}, "
+                          f"install it with 'pip install {package}'") from e
+    # a module imported elsewhere first cost nothing here, don't report 0 ms
+    if not loaded:
+        IMPORT_TIMES.setdefault(module, time.perf_counter() - start)
+    return mod
 
 
 class Camera(ABC):
 
+    # keep one instance open for the whole run instead of per capture
+    keep_open = False
+    # set_exposure is implemented, needed for exposure bracketing
+    supports_exposure = False
+
     def __init__(self, camera_type="generic"):
         self._camera_type = camera_type
 
+    @classmethod
+    def add_args(cls, parser) -> None:
+        """Add camera specific command line options."""
+
+    @classmethod
+    def check_args(cls, args) -> None:
+        """Raise ValueError if the parsed options cannot build the camera."""
+
+    @classmethod
+    def from_args(cls, args) -> "Camera":
+        return cls()
+
     def __enter__(self):
         return self
 
@@ -52,6 +99,20 @@ class Camera(ABC):
     def start(self):
         pass
 
+    def stream_source(self, preprocess=None) -> T.Callable:
+        """Frame source for MjpegServer.add_stream."""
+        if preprocess is None:
+            return self.capture
+        return lambda: preprocess(self.capture())
+
+    def set_exposure(self, exposure: T.Optional[int]) -> None:
+        """Set exposure time in microseconds, None restores auto exposure.
+
+        Only called on cameras with ``supports_exposure``.
+        """
+        raise NotImplementedError(
+            f"{self._camera_type} does not support exposure control")
+
     @abstractmethod
     def close(self):
         pass
@@ -60,24 +121,32 @@ class Camera(ABC):
         return f"Camera({self._camera_type})"
 
 
+@register("DummyCam")
 class DummyCam(Camera):
 
+    supports_exposure = True
+
     def __init__(self):
         super().__init__(camera_type="Dummy")
 
     def capture(self):
         rnd_image = np.random.randint(
-            0, 255, [1024, 1920, 3]).astype(dtype=np.uint8)
+            0, 255, [1024, 1920, 3], dtype=np.uint8)
         return rnd_image
 
+    def set_exposure(self, exposure):
+        pass
+
     def close(self):
         pass
 
 
+@register("WebCam")
 class WebCam(Camera):
 
     def __init__(self):
         super().__init__(camera_type="WebCam")
+        cv2 = import_backend("cv2", "opencv-python-headless", "WebCam")
         self._camera = cv2.VideoCapture(0)
 
     def close(self):
@@ -91,10 +160,15 @@ class WebCam(Camera):
         return frame
 
 
+@register("Basler")
 class Basler(Camera):
 
+    supports_exposure = True
+
     def __init__(self):
         super().__init__(camera_type="Basler")
+        self._pylon = pylon = import_backend(
+            "pypylon.pylon", "pypylon", "Basler")
         self._camera = pylon.InstantCamera(
             pylon.TlFactory.GetInstance().CreateFirstDevice())
         converter = pylon.ImageFormatConverter()
@@ -110,9 +184,16 @@ class Basler(Camera):
     def configure_camera(self):
         self._camera.ExposureAuto.SetValue("Continuous")
 
+    def set_exposure(self, exposure):
+        if exposure is None:
+            self.configure_camera()
+            return
+        self._camera.ExposureAuto.SetValue("Off")
+        self._camera.ExposureTime.SetValue(float(exposure))
+
     def capture(self):
         grabResult = self._camera.RetrieveResult(
-            5000, pylon.TimeoutHandling_ThrowException)
+            5000, self._pylon.TimeoutHandling_ThrowException)
         image = self._converter.Convert(grabResult)
         grabResult.Release()
         return image.GetArray()
@@ -122,11 +203,13 @@ class Basler(Camera):
         self._camera.Close()
 
 
+@register("DigitalCam")
 class DigitalCam(Camera):
 
     def __init__(self):
         super().__init__(camera_type="DigitalCam")
-        self._camera = gp.Camera()
+        self._gp = import_backend("gphoto2", "gphoto2", "DigitalCam")
+        self._camera = self._gp.Camera()
         # self._camera.init()
 
     def close(self):
@@ -138,15 +221,18 @@ class DigitalCam(Camera):
     def capture(self, tmp_path="/tmp/gp2_capture"):
         if not os.path.exists(tmp_path):
             os.makedirs(tmp_path)
+        gp = self._gp
         file_path = self._camera.capture(gp.GP_CAPTURE_IMAGE)
         target = os.path.join(tmp_path, file_path.name)
         camera_file = self._camera.file_get(
             file_path.folder, file_path.name, gp.GP_FILE_TYPE_NORMAL)
         camera_file.save(target)
+        cv2 = import_backend("cv2", "opencv-python-headless", "DigitalCam")
         image = cv2.imread(target)
         return image
 
 
+@register("PiCam")
 class PiCam(Camera):
 
     def __init__(self):
@@ -154,19 +240,26 @@ class PiCam(Camera):
         self._init_camera()
 
     def _init_camera(self):
-        self._camera = PiCamera()
+        picamera = import_backend("picamera", "picamera", "PiCam")
+        self._array = import_backend("picamera.array", "picamera", "PiCam")
+        self._camera = picamera.PiCamera()
         self._camera.resolution = (1280, 720)
         self._camera.start_preview()
         logger.info("Initializing PiCamera...")
         time.sleep(2)
 
+    def stream_source(self, preprocess=None):
+        if preprocess is None:
+            return self.stream
+        return super().stream_source(preprocess)
+
     def stream(self):
-        with PiRGBArray(self._camera) as stream:
+        with self._array.PiRGBArray(self._camera) as stream:
             self._camera.capture(stream, format='bgr')
             yield stream.array.astype(np.uint8)
 
     def capture(self):
-        with PiRGBArray(self._camera) as stream:
+        with self._array.PiRGBArray(self._camera) as stream:
             self._camera.capture(stream, format='bgr')
             return stream.array
 
@@ -175,7 +268,243 @@ class PiCam(Camera):
         self._camera.close()
 
 
+@register("ReplayCam")
+class ReplayCam(Camera):
+    """Replay stored frames from an image directory or a video file.
+
+    Images are found recursively (e.g. the server IMAGE_PATH with its
+    YYYY_MM sub directories) and paced by the timestamp in their
+    '%Y_%m_%d_%H_%M_%S.jpg' file name, videos by their frame rate.
+    ``speed`` scales the pace, 0 replays as fast as possible. A read-ahead
+    thread keeps up to ``prefetch`` files in memory as read from disk.
+    They are only decoded by ``capture`` or when the stream preprocesses
+    them, a plain mjpeg stream serves the original JPEG bytes.
+    """
+
+    EXTENSIONS = ('.jpg', '.jpeg', '.png')
+    # the replay position lives in the camera
+    keep_open = True
+
+    @classmethod
+    def add_args(cls, parser):
+        parser.add_argument("--source", default=None,
+                            help="Image directory or video file for ReplayCam")
+        parser.add_argument("--speed", type=float, default=1.0,
+                            help="ReplayCam speed factor, 0 for no pacing")
+
+    @classmethod
+    def check_args(cls, args):
+        if not args.source:
+            raise ValueError("ReplayCam needs --source")
+        if not os.path.exists(args.source):
+            raise ValueError(f"Replay source {args.source} not found")
+        if os.path.isdir(args.source) and not cls._list_images(args.source):
+            raise ValueError(f"No images found in {args.source}")
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.source, speed=args.speed)
+
+    def __init__(self, source: str, speed: float = 1.0,
+                 loop: bool = True, prefetch: int = 16):
+        super().__init__(camera_type="Replay")
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Replay source {source} not found")
+        self._cv2 = import_backend("cv2", "opencv-python-headless", "ReplayCam")
+        self._source = source
+        self._speed = speed
+        self._loop = loop
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._start = None
+        self._first_ts = None
+        # frame shared by all mjpeg viewers, see _advance
+        self._images = None
+        self._lock = None
+        self._frame_id = 0
+        self._frame = None
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _timestamp(path: str) -> T.Optional[float]:
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            return datetime.strptime(name, '%Y_%m_%d_%H_%M_%S').timestamp()
+        except ValueError:
+            return None
+
+    @classmethod
+    def _list_images(cls, source: str) -> T.List[str]:
+        return sorted(
+            path for path in glob.glob(
+                os.path.join(source, '**', '*'), recursive=True)
+            if path.lower().endswith(cls.EXTENSIONS))
+
+    def _image_times(self) -> T.List[T.Tuple[float, str]]:
+        """Files with their capture time, listed once per replay."""
+        if self._images is None:
+            files = self._list_images(self._source)
+            if not files:
+                raise FileNotFoundError(f"No images found in {self._source}")
+            # one clock for the whole directory, mixing file name times with
+            # anything else would make pacing wait for decades
+            stamps = [self._timestamp(path) for path in files]
+            if None in stamps:
+                logger.warning(f"Not all file names in {self._source} hold a "
+                               "capture time, pacing by modification time")
+                stamps = [os.path.getmtime(path) for path in files]
+            self._images = list(zip(stamps, files))
+        return self._images
+
+    def _read_images(self) -> T.Iterator[T.Tuple[float, bytes, None]]:
+        for ts, path in self._image_times():
+            with open(path, 'rb') as f:
+                data = f.read()
+            # decoded lazily, a plain stream serves the jpeg bytes as is
+            yield ts, data, None
+
+    def _read_video(self) -> T.Iterator[T.Tuple[float, bytes, np.ndarray]]:
+        video = self._cv2.VideoCapture(self._source)
+        fps = video.get(self._cv2.CAP_PROP_FPS) or 25.0
+        try:
+            index = 0
+            while True:
+                ret, frame = video.read()
+                if not ret:
+                    break
+                yield index / fps, None, frame
+                index += 1
+        finally:
+            video.release()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read_ahead(self):
+        reader = (self._read_images if os.path.isdir(self._source)
+                  else self._read_video)
+        offset = 0.0
+        try:
+            while not self._stop.is_set():
+                first_ts = last_ts = None
+                for ts, encoded, image in reader():
+                    if first_ts is None:
+                        first_ts = ts
+                    last_ts = ts
+                    if not self._put((ts + offset, encoded, image)):
+                        return
+                if last_ts is None or not self._loop:
+                    break
+                # keep timestamps increasing across loops
+                offset += last_ts - first_ts + 1.0
+        except Exception:
+            logger.error("Replay reader failed", exc_info=True)
+        self._put(None)
+
+    def _get(self) -> T.Optional[T.Tuple[float, bytes, np.ndarray]]:
+        item = self._queue.get()
+        if item is None:
+            # keep signalling the end to any later caller
+            self._queue.put(None)
+        return item
+
+    def _delay(self, ts: float) -> float:
+        """Seconds until the frame taken at ``ts`` is due."""
+        if self._start is None:
+            self._start, self._first_ts = time.monotonic(), ts
+            return 0.0
+        if self._speed <= 0:
+            return 0.0
+        due = self._start + (ts - self._first_ts) / self._speed
+        return due - time.monotonic()
+
+    def _decode(self, item) -> T.Optional[np.ndarray]:
+        _, data, image = item
+        if image is None:
+            image = self._cv2.imdecode(
+                np.frombuffer(data, dtype=np.uint8), self._cv2.IMREAD_COLOR)
+        return image
+
+    def _encode(self, item, preprocess) -> T.Optional[bytes]:
+        _, data, _ = item
+        if preprocess is None and data is not None and data[:2] == b'\xff\xd8':
+            return data
+        image = self._decode(item)
+        if image is None:
+            return None
+        if preprocess is not None:
+            image = preprocess(image)
+        return self._cv2.imencode('.jpg', image)[1].tobytes()
+
+    def capture(self):
+        while True:
+            item = self._get()
+            if item is None:
+                return None
+            image = self._decode(item)
+            if image is not None:
+                break
+            logger.warning("Skipping unreadable replay frame")
+        delay = self._delay(item[0])
+        if delay > 0:
+            time.sleep(delay)
+        return image
+
+    async def _advance(self, last_id: int, preprocess) -> T.Tuple[int, bytes]:
+        """Return the newest frame, waiting for the next one if seen.
+
+        Viewers share a single replay position: the first viewer that has
+        seen the current frame waits for the next one, viewers that are
+        behind get the current frame immediately.
+        """
+        if self._frame_id != last_id:
+            return self._frame_id, self._frame
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._frame_id == last_id:
+                loop = asyncio.get_running_loop()
+                while True:
+                    item = await loop.run_in_executor(None, self._get)
+                    if item is None:
+                        return self._frame_id, None
+                    frame = await loop.run_in_executor(
+                        None, self._encode, item, preprocess)
+                    if frame is not None:
+                        break
+                    logger.warning("Skipping unreadable replay frame")
+                delay = self._delay(item[0])
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._frame = frame
+                self._frame_id += 1
+            return self._frame_id, self._frame
+
+    def stream_source(self, preprocess=None):
+        async def frames():
+            frame_id = 0
+            while True:
+                frame_id, frame = await self._advance(frame_id, preprocess)
+                if frame is None:
+                    return
+                yield frame
+        return frames
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+
 def test_driver():
+    import cv2
+
     cam = Basler()
     image = cam.capture()
     # print(image.shape)
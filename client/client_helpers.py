@@ -7,11 +7,13 @@ import socket
 import time
 import typing as T
 
-import cv2
 import numpy as np
 import requests
 
-from .camera import Camera
+from .camera import Camera, import_backend
+from .stacking import FrameStacker
+
+cv2 = import_backend("cv2", "opencv-python-headless", "saving images")
 
 logging.basicConfig()
 logger = logging.getLogger('client_helpers')
@@ -32,6 +34,9 @@ config = config_data['client_config']
 LAT = config['LAT']
 LONG = config['LONG']
 WEATHER_API = config['WEATHER_API']
+# identify this device on the server, used as influx tags
+CAMERA = config.get('CAMERA') or socket.gethostname()
+LOCATION = config.get('LOCATION', 'balcony')
 URL = ("http://api.openweathermap.org/data/2.5/weather?"
        f"lat={LAT}&lon={LONG}&appid={WEATHER_API}")
 
@@ -46,8 +51,7 @@ def get_weather_data():
     return {'temperature': temp, 'wind': wind}
 
 
-def get_post_data(image: np.ndarray) -> T.Dict:
-    now_ts = time.time()
+def get_post_data(image: np.ndarray, now_ts: float) -> T.Dict:
     now_human_readable = datetime.fromtimestamp(
         now_ts).strftime('%Y_%m_%d_%H_%M_%S')
     image_name = f"{now_human_readable}.jpg"
@@ -55,16 +59,18 @@ def get_post_data(image: np.ndarray) -> T.Dict:
     b64_image = b64encode(buffer)
     data = {'image': b64_image.decode('utf-8'),
             'filename': image_name,
-            'timestamp': int(now_ts * 1000)}
+            'timestamp': int(now_ts * 1000),
+            'camera': CAMERA,
+            'location': LOCATION}
     data['weather'] = get_weather_data()
 
     return data
 
 
-def post_image(url: Path, image: np.ndarray) -> bool:
+def post_image(url: Path, image: np.ndarray, timestamp: float) -> bool:
 
     url = f"http://{url}:{server_port}{api_route}"
-    data = get_post_data(image)
+    data = get_post_data(image, timestamp)
     logger.info(f"posting image to {url}")
     res = requests.post(url, json=data, headers=HEADERS)
     if res.status_code == 200:
@@ -72,8 +78,8 @@ def post_image(url: Path, image: np.ndarray) -> bool:
     return False
 
 
-def save_image(path: Path, image: np.ndarray) -> bool:
-    now = datetime.now().strftime('%Y_%m_%d_%H_%M_%S')
+def save_image(path: Path, image: np.ndarray, timestamp: float) -> bool:
+    now = datetime.fromtimestamp(timestamp).strftime('%Y_%m_%d_%H_%M_%S')
     filename = os.path.join(path, f"{now}.jpg")
     logger.info(f"saving image to {filename}")
     status = cv2.imwrite(filename, image)
@@ -90,12 +96,24 @@ def is_ip(path: str) -> bool:
 
 def capture_image(
     cam: Camera,
-    save_func: T.Callable[[np.ndarray], bool]
+    save_func: T.Callable[[np.ndarray, float], bool],
+    preprocess: T.Optional[T.Callable[[np.ndarray], np.ndarray]] = None,
+    stacker: T.Optional[FrameStacker] = None
 ) -> None:
 
-    image = cam.capture()
+    # capture time, not the later save/post time, goes with the image
+    timestamp = time.time()
+    if stacker is not None:
+        image = stacker.capture(cam)
+    else:
+        image = cam.capture()
+    if image is None:
+        logger.warning(f"No image captured from {cam}")
+        return
+    if preprocess is not None:
+        image = preprocess(image)
     try:
-        status = save_func(image)
+        status = save_func(image, timestamp)
         if not status:
             logger.warning("Failed to post/save image")
     except Exception:
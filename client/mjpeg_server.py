@@ -1,10 +1,14 @@
 import asyncio
 from functools import partial
+import inspect
 import logging
 import os
 
 from aiohttp import web, MultipartWriter
-import cv2
+
+from .camera import import_backend
+
+cv2 = import_backend("cv2", "opencv-python-headless", "mjpeg stream")
 logging.basicConfig()
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
 logger = logging.getLogger("mjpeg-server")
@@ -12,6 +16,16 @@ log_level = getattr(logging, log_level)
 logger.setLevel(log_level)
 
 
+async def _sync_frames(get_frame):
+    while True:
+        try:
+            frame = get_frame()
+        except Exception:
+            logger.error("Failed to get frame", exc_info=True)
+            return
+        yield frame
+
+
 async def mjpeg_stream(get_frame, request):
     my_boundary = 'image-boundary'
     response = web.StreamResponse(
@@ -22,18 +36,21 @@ async def mjpeg_stream(get_frame, request):
         }
     )
     await response.prepare(request)
-    while True:
-        try:
-            frame = get_frame()
-        except Exception:
-            logger.error("Failed to get frame", exc_info=True)
-            break
-
+    # async generator sources (e.g. ReplayCam) wait without blocking the loop
+    if inspect.isasyncgenfunction(get_frame):
+        frames = get_frame()
+    else:
+        frames = _sync_frames(get_frame)
+    async for frame in frames:
         if frame is None:
             logger.warning("No frame recieved, exiting...")
             break
-        jpeg_frame = cv2.imencode('.jpg', frame)[1]
-        frame_bytes = jpeg_frame.tobytes()
+        if isinstance(frame, bytes):
+            # already jpeg encoded
+            frame_bytes = frame
+        else:
+            jpeg_frame = cv2.imencode('.jpg', frame)[1]
+            frame_bytes = jpeg_frame.tobytes()
 
         with MultipartWriter('image/jpeg', boundary=my_boundary) as mpwriter:
             mpwriter.append(frame_bytes, {
@@ -0,0 +1,177 @@
+from argparse import ArgumentParser, Namespace
+import logging
+import time
+import typing as T
+
+import numpy as np
+
+from .camera import import_backend
+
+logging.basicConfig()
+logger = logging.getLogger('preprocess')
+logger.setLevel(logging.INFO)
+
+Crop = T.Tuple[int, int, int, int]
+Size = T.Tuple[int, int]
+
+# cv2 rotate codes by name, cv2 itself is only imported once it is used
+ROTATIONS = {90: 'ROTATE_90_CLOCKWISE',
+             180: 'ROTATE_180',
+             270: 'ROTATE_90_COUNTERCLOCKWISE'}
+
+
+class Preprocessor:
+    """Crop, grayscale, resize and rotate frames between capture and save.
+
+    Steps run in that order so that every later step works on the smallest
+    possible frame. Output buffers are allocated on the first frame and
+    reused as long as the input shape does not change, so the returned
+    array is only valid until the next call.
+    """
+
+    def __init__(self,
+                 crop: T.Optional[Crop] = None,
+                 size: T.Optional[Size] = None,
+                 rotate: int = 0,
+                 grayscale: bool = False):
+        if rotate not in (0, *ROTATIONS):
+            raise ValueError(f"Unsupported rotation {rotate}")
+        self._crop = crop
+        self._size = size
+        self._rotate = rotate
+        self._grayscale = grayscale
+        self._buffers = {}
+        self._cv2 = import_backend("cv2", "opencv-python-headless",
+                                   "preprocessing")
+
+    def _buffer(self, name: str, shape: T.Tuple[int, ...]) -> np.ndarray:
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, dtype=np.uint8)
+            self._buffers[name] = buf
+        return buf
+
+    def _crop_view(self, image: np.ndarray) -> np.ndarray:
+        height, width = image.shape[:2]
+        x, y, w, h = self._crop
+        x0, y0 = min(max(x, 0), width), min(max(y, 0), height)
+        x1, y1 = min(x0 + w, width), min(y0 + h, height)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"Crop {self._crop} outside of "
+                             f"{width}x{height} frame")
+        # slicing returns a view, no pixels are copied here
+        return image[y0:y1, x0:x1]
+
+    def __call__(self, image: np.ndarray) -> np.ndarray:
+        cv2 = self._cv2
+        if self._crop is not None:
+            image = self._crop_view(image)
+
+        if self._grayscale and image.ndim == 3:
+            dst = self._buffer('gray', image.shape[:2])
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
+
+        if self._size is not None:
+            w, h = self._size
+            dst = self._buffer('resize', (h, w) + image.shape[2:])
+            image = cv2.resize(image, (w, h), dst=dst,
+                               interpolation=cv2.INTER_AREA)
+
+        if self._rotate:
+            h, w = image.shape[:2]
+            if self._rotate != 180:
+                h, w = w, h
+            dst = self._buffer('rotate', (h, w) + image.shape[2:])
+            image = cv2.rotate(image, getattr(cv2, ROTATIONS[self._rotate]),
+                               dst=dst)
+
+        return image
+
+    def __repr__(self):
+        return (f"Preprocessor(crop={self._crop}, size={self._size}, "
+                f"rotate={self._rotate}, grayscale={self._grayscale})")
+
+    @classmethod
+    def from_args(cls, args: Namespace) -> T.Optional["Preprocessor"]:
+        if not (args.crop or args.resize or args.rotate or args.gray):
+            return None
+        return cls(crop=args.crop, size=args.resize,
+                   rotate=args.rotate, grayscale=args.gray)
+
+
+def _int_tuple(value: str, sep: str, length: int) -> T.Tuple[int, ...]:
+    parts = tuple(int(v) for v in value.lower().split(sep))
+    if len(parts) != length:
+        raise ValueError(f"Expected {length} values separated by '{sep}'")
+    return parts
+
+
+def add_preprocess_args(parser: ArgumentParser) -> None:
+    parser.add_argument("--crop", type=lambda v: _int_tuple(v, ',', 4),
+                        default=None, metavar="X,Y,W,H",
+                        help="Region of interest to keep")
+    parser.add_argument("--resize", type=lambda v: _int_tuple(v, 'x', 2),
+                        default=None, metavar="WxH",
+                        help="Output frame size")
+    parser.add_argument("--rotate", type=int, default=0,
+                        choices=[0, 90, 180, 270],
+                        help="Clockwise rotation in degrees")
+    parser.add_argument("--gray", action="store_true",
+                        help="Convert frames to grayscale")
+
+
+def benchmark(preprocess: Preprocessor, cam, frames: int = 50) -> None:
+    """Per frame cpu time and jpeg payload, raw and preprocessed.
+
+    Both variants are measured on the same captured frames. Use a real
+    scene (e.g. ReplayCam) for payload sizes, DummyCam noise does not
+    compress like one. CPU time is taken with ``thread_time`` so camera
+    threads (ReplayCam read-ahead) are not counted, and OpenCV is limited
+    to the calling thread for the run so its worker threads are not
+    missed either.
+    """
+    import cv2
+
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)
+    results = {"raw": [0.0, 0], repr(preprocess): [0.0, 0]}
+    count = 0
+    try:
+        for _ in range(frames):
+            image = cam.capture()
+            if image is None:
+                break
+            count += 1
+            for name, func in (("raw", lambda image: image),
+                               (repr(preprocess), preprocess)):
+                start = time.thread_time()
+                buffer = cv2.imencode('.jpg', func(image))[1]
+                results[name][0] += time.thread_time() - start
+                results[name][1] += buffer.nbytes
+    finally:
+        cv2.setNumThreads(threads)
+
+    if not count:
+        print(f"{cam}: no frames captured")
+        return
+    print(f"{cam}, {count} frames")
+    for name, (cpu_time, payload) in results.items():
+        print(f"{name}: {cpu_time / count * 1000:.2f} ms cpu/frame, "
+              f"{payload / count / 1024:.1f} KiB/frame")
+
+
+if __name__ == "__main__":
+
+    from . import camera
+
+    parser = ArgumentParser(description="Benchmark frame preprocessing")
+    camera.add_camera_args(parser, default="DummyCam")
+    # replay as fast as possible, not in real time
+    parser.set_defaults(speed=0.0)
+    add_preprocess_args(parser)
+    parser.add_argument("-n", "--frames", type=int, default=50)
+    args = parser.parse_args()
+    camera.check_camera_args(parser, args)
+    with camera.CAMERAS[args.camera].from_args(args) as cam:
+        benchmark(Preprocessor.from_args(args) or Preprocessor(), cam,
+                  args.frames)
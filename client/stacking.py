@@ -0,0 +1,164 @@
+from argparse import ArgumentParser, Namespace
+import logging
+import time
+import tracemalloc
+import typing as T
+
+import numpy as np
+
+from .camera import Camera, import_backend
+
+logging.basicConfig()
+logger = logging.getLogger('stacking')
+logger.setLevel(logging.INFO)
+
+METHODS = ["mean", "median", "mertens"]
+
+
+class FrameStacker:
+    """Capture a burst of frames from an open camera and merge them.
+
+    ``mean`` keeps a running float32 sum, ``median`` and ``mertens`` keep
+    the whole burst in a preallocated uint8 array. All buffers are reused
+    between bursts while the frame shape stays the same, so the returned
+    image is only valid until the next call.
+
+    With ``exposures`` (in microseconds) every frame of the burst is taken
+    at its own exposure, which is what ``mertens`` exposure fusion expects.
+    """
+
+    def __init__(self,
+                 frames: int = 4,
+                 method: str = "mean",
+                 exposures: T.Optional[T.Sequence[int]] = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown stacking method {method}")
+        if exposures:
+            frames = len(exposures)
+        if frames < 1:
+            raise ValueError("Burst needs at least one frame")
+        self._frames = frames
+        self._method = method
+        self._exposures = exposures
+        self._merge = None
+        if method == "mertens":
+            cv2 = import_backend("cv2", "opencv-python-headless", "mertens")
+            self._merge = cv2.createMergeMertens()
+        self._shape = None
+        self._burst = None
+        self._acc = None
+        self._out = None
+
+    def _allocate(self, shape: T.Tuple[int, ...]) -> None:
+        self._shape = shape
+        self._acc = np.empty(shape, dtype=np.float32)
+        self._out = np.empty(shape, dtype=np.uint8)
+        if self._method != "mean":
+            self._burst = np.empty((self._frames,) + shape, dtype=np.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        buffers = (self._burst, self._acc, self._out)
+        return sum(buf.nbytes for buf in buffers if buf is not None)
+
+    def _capture(self, cam: Camera, index: int) -> T.Optional[np.ndarray]:
+        if self._exposures:
+            cam.set_exposure(self._exposures[index])
+        frame = cam.capture()
+        if frame is None:
+            return None
+        if frame.shape != self._shape:
+            if index:
+                raise ValueError(f"Frame shape changed within burst: "
+                                 f"{self._shape} -> {frame.shape}")
+            self._allocate(frame.shape)
+        return frame
+
+    def capture(self, cam: Camera) -> T.Optional[np.ndarray]:
+        try:
+            for i in range(self._frames):
+                frame = self._capture(cam, i)
+                if frame is None:
+                    logger.warning(f"{cam} returned no frame, burst dropped")
+                    return None
+                if self._method == "mean":
+                    if i == 0:
+                        np.copyto(self._acc, frame)
+                    else:
+                        np.add(self._acc, frame, out=self._acc)
+                else:
+                    np.copyto(self._burst[i], frame)
+        finally:
+            if self._exposures:
+                try:
+                    cam.set_exposure(None)
+                except Exception:
+                    # do not hide an error raised during the burst
+                    logger.error("Failed to restore auto exposure",
+                                 exc_info=True)
+
+        if self._method != "mertens":
+            if self._method == "mean":
+                np.multiply(self._acc, 1.0 / self._frames, out=self._acc)
+            else:
+                # the burst is scratch space, let median partition it in place
+                np.median(self._burst, axis=0, out=self._acc,
+                          overwrite_input=True)
+            # mean and even-sized median give .5 values, + 0.5 so the
+            # unsafe cast below rounds instead of truncating
+            np.add(self._acc, 0.5, out=self._acc)
+        else:
+            fused = self._merge.process(list(self._burst))
+            np.multiply(fused, 255, out=self._acc)
+            np.clip(self._acc, 0, 255, out=self._acc)
+        np.copyto(self._out, self._acc, casting='unsafe')
+        return self._out
+
+    def __repr__(self):
+        return (f"FrameStacker(frames={self._frames}, method={self._method}, "
+                f"exposures={self._exposures})")
+
+    @classmethod
+    def from_args(cls, args: Namespace) -> T.Optional["FrameStacker"]:
+        if args.burst <= 1 and not args.bracket:
+            return None
+        return cls(frames=args.burst, method=args.stack,
+                   exposures=args.bracket)
+
+
+def add_stacking_args(parser: ArgumentParser) -> None:
+    parser.add_argument("--burst", type=int, default=1,
+                        help="Frames to capture and merge per interval")
+    parser.add_argument("--stack", default="mean", choices=METHODS,
+                        help="Method used to merge a burst")
+    parser.add_argument("--bracket", default=None, metavar="US,US,...",
+                        type=lambda v: [int(e) for e in v.split(',')],
+                        help="Exposure times in microseconds, one per frame")
+
+
+def benchmark(stacker: FrameStacker, bursts: int = 10) -> None:
+    from .camera import DummyCam
+
+    with DummyCam() as cam:
+        stacker.capture(cam)  # allocate buffers before measuring
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(bursts):
+            stacker.capture(cam)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"{stacker}: {elapsed / bursts * 1000:.1f} ms/burst, "
+          f"{stacker.nbytes / 2**20:.1f} MiB buffers, "
+          f"{peak / 2**20:.1f} MiB peak per-burst allocations")
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Benchmark burst stacking")
+    add_stacking_args(parser)
+    parser.add_argument("-n", "--bursts", type=int, default=10)
+    args = parser.parse_args()
+    benchmark(FrameStacker(max(args.burst, 1), args.stack, args.bracket),
+              args.bursts)
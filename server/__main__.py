@@ -3,6 +3,7 @@ import os
 import json
 from aiohttp import web
 from .server import routes
+from .relay import StreamRelay
 
 with open('resource/secret.json') as f:
     config_data = json.load(f)
@@ -11,6 +12,8 @@ config = config_data['server_config']
 
 PATH = config["IMAGE_PATH"]
 PORT = str(config["PORT"])
+# camera name -> client mjpeg url, re-broadcast under /live/
+STREAMS = config.get("STREAMS", {})
 
 
 if __name__ == "__main__":
@@ -26,4 +29,6 @@ if __name__ == "__main__":
     app = web.Application()
     app['data_path'] = PATH
     app.add_routes(routes)
+    if STREAMS:
+        StreamRelay(STREAMS).setup(app)
     web.run_app(app, port=args.port)
@@ -0,0 +1,160 @@
+from argparse import ArgumentParser
+from datetime import datetime
+import logging
+import os
+import time
+import typing as T
+
+from .influx_handler import InfluxHandler
+from .server import config, influx_args, INFLUX_BUCKET, DEFAULT_LOCATION
+
+logging.basicConfig()
+logger = logging.getLogger("backfill")
+logger.setLevel(logging.INFO)
+
+MEASUREMENT = "image_data"
+BATCH_SIZE = 5000
+
+
+def _escape_tag(val: str) -> str:
+    return (val.replace('\\', '\\\\').replace(',', '\\,')
+            .replace('=', '\\=').replace(' ', '\\ '))
+
+
+def _escape_field(val: str) -> str:
+    return val.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def image_timestamp(filename: str) -> T.Optional[int]:
+    """Capture time in ms from a '%Y_%m_%d_%H_%M_%S.jpg' file name.
+
+    File names carry the client's local time, they are interpreted in the
+    local time zone of the machine running the import.
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    try:
+        return int(datetime.strptime(name, '%Y_%m_%d_%H_%M_%S').timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def to_ms(val: str) -> int:
+    return int(datetime.fromisoformat(val).timestamp() * 1000)
+
+
+def to_line(filename: str, timestamp: int, tags: T.Dict[str, str]) -> str:
+    tag_str = ''.join(f",{_escape_tag(k)}={_escape_tag(v)}"
+                      for k, v in sorted(tags.items()))
+    return (f'{MEASUREMENT}{tag_str} '
+            f'image="{_escape_field(filename)}" {timestamp}')
+
+
+def path_camera(path: str, root: str) -> T.Optional[str]:
+    """Camera of a directory below ``path``.
+
+    The server stores images as '<camera>/%Y_%m/<file>', images from
+    clients without a camera (and older servers) as '%Y_%m/<file>'.
+    """
+    top = os.path.relpath(root, path).split(os.sep)[0]
+    if top == os.curdir:
+        return None
+    try:
+        datetime.strptime(top, '%Y_%m')
+        return None
+    except ValueError:
+        return top
+
+
+def iter_lines(path: str,
+               tags: T.Dict[str, str],
+               since: T.Optional[int] = None,
+               until: T.Optional[int] = None,
+               camera: T.Optional[str] = None) -> T.Iterator[str]:
+    """Line protocol for images captured in [since, until) (ms).
+
+    The camera tag is taken from the directory layout, ``camera`` is only
+    used for images that are not below a camera directory.
+    """
+    path = os.path.realpath(path)
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        root_tags = dict(tags)
+        root_camera = path_camera(path, root) or camera
+        if root_camera:
+            root_tags["camera"] = root_camera
+        elif any(name.lower().endswith('.jpg') for name in files):
+            logger.warning(f"Skipping {root}, no camera directory, "
+                           "pass --camera for this layout")
+            continue
+        for name in sorted(files):
+            if not name.lower().endswith('.jpg'):
+                continue
+            timestamp = image_timestamp(name)
+            if timestamp is None:
+                logger.warning(f"Skipping {name}, no timestamp in file name")
+                continue
+            if since is not None and timestamp < since:
+                continue
+            if until is not None and timestamp >= until:
+                continue
+            yield to_line(os.path.join(root, name), timestamp, root_tags)
+
+
+def backfill(path: str,
+             tags: T.Dict[str, str],
+             bucket: str = INFLUX_BUCKET,
+             batch_size: int = BATCH_SIZE,
+             since: T.Optional[int] = None,
+             until: T.Optional[int] = None,
+             dry_run: bool = False,
+             camera: T.Optional[str] = None) -> int:
+    count = 0
+    start = time.perf_counter()
+    batch = []
+    with InfluxHandler(**influx_args) as influx_handler:
+        for line in iter_lines(path, tags, since, until, camera):
+            batch.append(line)
+            if len(batch) >= batch_size:
+                if not dry_run:
+                    influx_handler.write_lines(bucket, batch)
+                count += len(batch)
+                batch = []
+        if batch and not dry_run:
+            influx_handler.write_lines(bucket, batch)
+        count += len(batch)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"wrote {count} points in {elapsed:.2f} s "
+                f"({count / max(elapsed, 1e-9):.0f} points/s)")
+    return count
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Import stored images into influx")
+    parser.add_argument('-p', '--path', default=config["IMAGE_PATH"],
+                        help="Image directory to import")
+    parser.add_argument('-c', '--camera', default=None,
+                        help="Camera tag for images that are not stored "
+                        "below a camera directory, the client_config CAMERA "
+                        "of the client that took them or else its hostname")
+    parser.add_argument('-l', '--location', default=DEFAULT_LOCATION,
+                        help="Location tag for the imported points")
+    parser.add_argument('-b', '--batch-size', type=int, default=BATCH_SIZE,
+                        help="Points per write request")
+    # images posted to the server already have a point (at the time it
+    # received them), bound the import to ranges without points
+    parser.add_argument('--since', type=to_ms, default=None,
+                        help="Only import images taken at or after this "
+                        "local time, e.g. 2021-03-01T00:00")
+    parser.add_argument('--until', type=to_ms, default=None,
+                        help="Only import images taken before this "
+                        "local time")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Walk the directory without writing")
+    args = parser.parse_args()
+
+    tags = {"location": args.location}
+    backfill(args.path, tags, batch_size=args.batch_size,
+             since=args.since, until=args.until, dry_run=args.dry_run,
+             camera=args.camera)
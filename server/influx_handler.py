@@ -1,6 +1,7 @@
 from collections import namedtuple
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.domain.write_precision import WritePrecision
 
 TOKEN = ""
 INFLUX_INFO = namedtuple("INFLUX_INFO",
@@ -17,7 +18,7 @@ class InfluxHandler:
                  ):
 
         if not host.startswith("http"):
-            url = f"http://{host}"
+            host = f"http://{host}"
 
         url = f"{host}:{port}"
 
@@ -40,8 +41,15 @@ class InfluxHandler:
 
         self._write_api = self._client.write_api(write_options=SYNCHRONOUS)
 
-    def post(self, bucket, data):
-        data_point = Point.from_dict(data)
+    def post(self, bucket, data, write_precision=WritePrecision.MS):
+        data_point = Point.from_dict(data, write_precision=write_precision)
         if self._write_api is None:
             self._init()
-        self._write_api.write(bucket, self._db_info.org, data_point)
+        self._write_api.write(bucket, self._db_info.org, data_point,
+                              write_precision=write_precision)
+
+    def write_lines(self, bucket, lines, write_precision=WritePrecision.MS):
+        if self._write_api is None:
+            self._init()
+        self._write_api.write(bucket, self._db_info.org, lines,
+                              write_precision=write_precision)
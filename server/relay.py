@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import typing as T
+
+from aiohttp import (web, ClientSession, ClientError, ClientTimeout,
+                     MultipartWriter)
+
+logging.basicConfig()
+logger = logging.getLogger("relay")
+logger.setLevel(logging.INFO)
+
+BOUNDARY = 'image-boundary'
+RETRY_INTERVAL = 5
+# an mjpeg response never ends, only a stalled connection is an error
+UPSTREAM_TIMEOUT = ClientTimeout(total=None, sock_connect=10, sock_read=60)
+# drop an upstream part that grows beyond this without completing
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def _content_length(headers: bytes) -> T.Optional[int]:
+    for line in headers.decode('latin-1').split('\r\n'):
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def take_frames(buffer: bytearray, delimiter: bytes) -> T.List[bytes]:
+    """Remove complete multipart parts from ``buffer``, return their bodies.
+
+    A part with a Content-Length header (MjpegServer sends one) is complete
+    as soon as its body has arrived, so it is not held back until the next
+    boundary. Parts without one end at the next boundary.
+    """
+    frames = []
+    while True:
+        start = buffer.find(delimiter)
+        if start == -1:
+            # keep only a tail that may hold a split delimiter
+            del buffer[:max(len(buffer) - len(delimiter), 0)]
+            return frames
+        del buffer[:start]
+        header_end = buffer.find(b'\r\n\r\n')
+        if header_end == -1:
+            return frames
+        body_start = header_end + 4
+        length = _content_length(bytes(buffer[len(delimiter):header_end]))
+        if length is not None:
+            if len(buffer) < body_start + length:
+                return frames
+            body = bytes(buffer[body_start:body_start + length])
+            del buffer[:body_start + length]
+        else:
+            end = buffer.find(delimiter, body_start)
+            if end == -1:
+                return frames
+            body = bytes(buffer[body_start:end]).rstrip(b'\r\n')
+            del buffer[:end]
+        if body:
+            frames.append(body)
+
+
+class CameraFeed:
+    """Latest-frame buffer for one upstream MJPEG stream.
+
+    The upstream is only pulled while at least one viewer is connected.
+    Viewers always receive the newest frame, so a slow viewer skips the
+    frames it could not keep up with instead of queueing them.
+    """
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self._frame = None
+        self._frame_id = 0
+        self._viewers = 0
+        self._task = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def viewers(self):
+        return self._viewers
+
+    async def _publish(self, frame: bytes):
+        async with self._changed:
+            self._frame = frame
+            self._frame_id += 1
+            self._changed.notify_all()
+
+    async def _read_frames(self, session: ClientSession):
+        async with session.get(self.url) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+            _, _, boundary = content_type.partition('boundary=')
+            delimiter = b'--' + boundary.strip('"').encode()
+            logger.info(f"relaying {self.name} from {self.url}")
+            buffer = bytearray()
+            async for chunk in response.content.iter_any():
+                buffer += chunk
+                for frame in take_frames(buffer, delimiter):
+                    await self._publish(frame)
+                if len(buffer) > MAX_FRAME_SIZE:
+                    logger.warning(f"{self.name}: oversized frame dropped")
+                    buffer.clear()
+                if not self._viewers:
+                    return
+
+    async def _pull(self):
+        async with ClientSession(timeout=UPSTREAM_TIMEOUT) as session:
+            while self._viewers:
+                try:
+                    await self._read_frames(session)
+                except (ClientError, asyncio.TimeoutError):
+                    logger.warning(f"{self.name}: upstream {self.url} "
+                                   "unavailable", exc_info=True)
+                if self._viewers:
+                    await asyncio.sleep(RETRY_INTERVAL)
+        logger.info(f"{self.name}: no viewers, upstream closed")
+
+    def subscribe(self):
+        self._viewers += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._pull())
+
+    def unsubscribe(self):
+        self._viewers -= 1
+
+    async def next_frame(self, last_id: int) -> T.Tuple[int, bytes]:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._frame_id != last_id)
+            return self._frame_id, self._frame
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class StreamRelay:
+    """Re-broadcast camera MJPEG streams to any number of viewers."""
+
+    def __init__(self, streams: T.Dict[str, str], prefix: str = '/live'):
+        self._prefix = prefix
+        self._feeds = {name: CameraFeed(name, url)
+                       for name, url in streams.items()}
+
+    async def index_handler(self, request):  # pylint: disable=unused-argument
+        items = ''.join(
+            f'<li><a href="{self._prefix}/{name}">{name}</a> '
+            f'({feed.viewers} viewers)<br>'
+            f'<img src="{self._prefix}/{name}" width="640"></li>'
+            for name, feed in self._feeds.items())
+        return web.Response(text=f"<html><body><ul>{items}</ul></body></html>",
+                            content_type='text/html')
+
+    async def stream_handler(self, request):
+        feed = self._feeds.get(request.match_info['name'])
+        if feed is None:
+            raise web.HTTPNotFound()
+
+        response = web.StreamResponse(
+            status=200,
+            reason='OK',
+            headers={
+                'Content-Type': f'multipart/x-mixed-replace;boundary={BOUNDARY}'
+            }
+        )
+        await response.prepare(request)
+        feed.subscribe()
+        frame_id = 0
+        try:
+            while True:
+                frame_id, frame = await feed.next_frame(frame_id)
+                with MultipartWriter('image/jpeg', boundary=BOUNDARY) as mpwriter:
+                    mpwriter.append(frame, {'Content-Type': 'image/jpeg'})
+                    await mpwriter.write(response, close_boundary=False)
+                await response.write(b"\r\n")
+        except ConnectionResetError:
+            logger.info(f"{feed.name}: viewer disconnected")
+        finally:
+            feed.unsubscribe()
+        return response
+
+    async def _close(self, app):  # pylint: disable=unused-argument
+        for feed in self._feeds.values():
+            await feed.close()
+
+    def setup(self, app: web.Application):
+        app.router.add_route("GET", f"{self._prefix}/", self.index_handler)
+        app.router.add_route("GET", f"{self._prefix}/{{name}}",
+                             self.stream_handler)
+        app.on_cleanup.append(self._close)
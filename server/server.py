@@ -3,6 +3,7 @@ from datetime import datetime
 import json
 import logging
 import os
+import time
 import typing as T
 
 from aiohttp import web  # , MultipartReader
@@ -38,8 +39,11 @@ influx_args = {'token': INFLUX_TOKEN,
                }
 
 
-def now():
-    return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+DEFAULT_LOCATION = "balcony"
+
+
+def now_ms():
+    return int(time.time() * 1000)
 
 
 class Record:
@@ -47,7 +51,10 @@ class Record:
         self._image = None
         self._timestamp = None
         self._filename = None
+        self._month = None
         self._weather = None
+        self._camera = None
+        self._location = DEFAULT_LOCATION
         self.path = '.'
 
     @property
@@ -70,14 +77,19 @@ class Record:
 
     @property
     def filename(self):
-        return self._filename
+        # built on access, path and camera may be set after the file name
+        if self._filename is None:
+            return None
+        full_path = os.path.realpath(self.path)
+        if self.camera:
+            # '<path>/<camera>/%Y_%m/', clients name files by the second only
+            full_path = os.path.join(full_path, self.camera)
+        return os.path.join(full_path, self._month, self._filename)
 
     @filename.setter
     def filename(self, val: str):
-        dir_name = datetime.utcnow().strftime('%Y_%m')
-        full_path = os.path.realpath(self.path)
-        val = os.path.join(full_path, dir_name, val)
-        self._filename = val
+        self._month = datetime.utcnow().strftime('%Y_%m')
+        self._filename = os.path.basename(val)
 
     @property
     def weather(self):
@@ -87,13 +99,38 @@ class Record:
     def weather(self, val: T.Dict):
         self._weather = val
 
+    @property
+    def camera(self):
+        return self._camera
+
+    @camera.setter
+    def camera(self, val: str):
+        if val in (os.curdir, os.pardir) or os.sep in val:
+            raise ValueError(f"Invalid camera name {val!r}")
+        self._camera = val
+
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, val: str):
+        self._location = val
+
+    @property
+    def tags(self):
+        tags = {"location": self.location}
+        if self.camera:
+            tags["camera"] = self.camera
+        return tags
+
     @property
     def data(self):
+        # client capture time in ms, older clients do not send it
+        timestamp = self.timestamp or now_ms()
         influx_body = {"measurement": "image_data",
-                       "tags": {
-                           "location": "balcony"
-                       },
-                       "time": now(),
+                       "tags": self.tags,
+                       "time": int(timestamp),
                        "fields": {
                            "image": self.filename,
                            "temperature": self.weather['temperature'],
@@ -105,6 +142,7 @@ class Record:
     def __str__(self):
         return (f"{self.filename}, "
                 f"{self.timestamp}, "
+                f"{self.tags}, "
                 f"{self.weather}")
 
 